@@ -6,15 +6,17 @@ DeepFri 上传 → JSON → GO 富集分析 一键脚本
 
 import os
 import time
-import json
+import orjson
 import requests
+from requests_toolbelt import MultipartEncoder
 import pandas as pd
 from typing import Dict, Any
 
 # GO 分析部分
-from goatools.obo_parser import GODag
 from goatools.go_enrichment import GOEnrichmentStudy
 
+from go_utils import backoff, ensure_obo, json_of, load_godag
+
 # ========== 1. 上传 & 轮询 ==========
 def upload_and_get_result(file_path: str,
                           workspace_id: str = "HE93D7",
@@ -32,11 +34,16 @@ def upload_and_get_result(file_path: str,
     }
 
     with open(file_path, "rb") as f:
-        files = {"file": (os.path.basename(file_path), f, "application/octet-stream")}
-        data = {"inputType": "structureFile", "tags": ""}
-        upload_resp = session.post(upload_url, headers=headers, files=files, data=data)
+        # 流式 multipart 上传，不把整个 PDB 读入内存
+        m = MultipartEncoder(fields={
+            "file": (os.path.basename(file_path), f, "application/octet-stream"),
+            "inputType": "structureFile",
+            "tags": ""
+        })
+        upload_resp = session.post(upload_url, data=m,
+                                   headers={**headers, "Content-Type": m.content_type})
     upload_resp.raise_for_status()
-    predictions = upload_resp.json().get("predictions", [])
+    predictions = json_of(upload_resp).get("predictions", [])
     if not predictions:
         raise RuntimeError("上传失败，未返回任务信息")
     task_name = predictions[0]["name"]
@@ -44,10 +51,11 @@ def upload_and_get_result(file_path: str,
 
     task_url = f"https://beta.api.deepfri.flatironinstitute.org/workspace/{workspace_id}/predictions/{task_name}"
     start = time.time()
-    while True:
+    for delay in backoff(1.0, poll_interval):
         resp = session.get(task_url, headers=headers)
         resp.raise_for_status()
-        info = resp.json().get("prediction") or resp.json().get("predictions", [{}])[0]
+        info_json = json_of(resp)
+        info = info_json.get("prediction") or info_json.get("predictions", [{}])[0]
         state = info.get("state", "")
         print(f"[轮询] 状态: {state}")
         if state == "finished" and info.get("data"):
@@ -57,12 +65,12 @@ def upload_and_get_result(file_path: str,
             raise RuntimeError("任务失败")
         if time.time() - start > max_wait:
             raise TimeoutError("等待超时")
-        time.sleep(poll_interval)
+        time.sleep(delay)
 
     if save_json:
         out_json = os.path.join(output_dir, f"{task_name}_result.json")
-        with open(out_json, "w", encoding="utf-8") as f:
-            json.dump(final_data, f, ensure_ascii=False, indent=2)
+        with open(out_json, "wb") as f:
+            f.write(orjson.dumps(final_data, option=orjson.OPT_INDENT_2))
         print(f"[保存] JSON 已写入 {out_json}")
     return final_data
 
@@ -71,19 +79,28 @@ def upload_and_get_result(file_path: str,
 def extract_go_predictions(json_data: Dict[str, Any],
                            score_threshold: float = 0.0) -> pd.DataFrame:
     ns_map = {"cnn_cc": "CC", "cnn_mf": "MF", "cnn_bp": "BP", "cnn_ec": "EC"}
-    records = []
+    # 按列收集，扫描时即去重（保留首次出现）
+    seen = set()
+    go_terms, names, scores, namespaces = [], [], [], []
     for model, ns in ns_map.items():
         for p in json_data.get("A", {}).get(model, {}).get("predictions", []):
+            go_term = p["go_term"]
+            if go_term in seen:
+                continue
             score = p.get("go_term_score", 0.0)
-            if score >= score_threshold:
-                records.append({
-                    "go_term": p["go_term"],
-                    "name": p["go_term_name"],
-                    "score": score,
-                    "namespace": ns
-                })
-    df = pd.DataFrame(records).drop_duplicates(subset=["go_term"])
-    return df
+            if score < score_threshold:
+                continue
+            seen.add(go_term)
+            go_terms.append(go_term)
+            names.append(p["go_term_name"])
+            scores.append(score)
+            namespaces.append(ns)
+    return pd.DataFrame({
+        "go_term": go_terms,
+        "name": names,
+        "score": scores,
+        "namespace": namespaces
+    })
 
 
 # ========== 3. GO 富集分析 ==========
@@ -95,7 +112,7 @@ def go_enrichment(df: pd.DataFrame,
     返回显著条目 DataFrame
     """
     # 1. 构建 GO  DAG
-    godag = GODag(obo_path)
+    godag = load_godag(obo_path)
 
     # 2. 基因列表 & GO 映射（这里仅演示单蛋白）
     study_genes = {"PROTEIN_A"}
@@ -113,16 +130,14 @@ def go_enrichment(df: pd.DataFrame,
     if not sig:
         print("[富集] 无显著条目")
         return pd.DataFrame()
-    df_out = pd.DataFrame([
-        {
-            "GO": r.GO,
-            "name": r.name,
-            "namespace": r.namespace,
-            "p_uncorrected": r.p_uncorrected,
-            "p_fdr_bh": r.p_fdr_bh,
-            "depth": r.depth
-        } for r in sig
-    ])
+    df_out = pd.DataFrame({
+        "GO": [r.GO for r in sig],
+        "name": [r.name for r in sig],
+        "namespace": [r.namespace for r in sig],
+        "p_uncorrected": [r.p_uncorrected for r in sig],
+        "p_fdr_bh": [r.p_fdr_bh for r in sig],
+        "depth": [r.depth for r in sig]
+    })
     return df_out
 
 
@@ -137,13 +152,10 @@ def main():
     print(df_go.head())
 
     print("3. 下载 GO 结构文件...")
-    obo = "go-basic.obo"
-    if not os.path.exists(obo):
-        print("正在下载 go-basic.obo...")
-        os.system(f"wget -q http://geneontology.org/ontology/{obo}")
+    obo = ensure_obo("go-basic.obo")
 
     print("4. 执行 GO 富集分析...")
-    df_enrich = go_enrichment(df_go)
+    df_enrich = go_enrichment(df_go, obo_path=obo)
     if not df_enrich.empty:
         csv_out = "deepfri_go_enrichment.csv"
         df_enrich.to_csv(csv_out, index=False)
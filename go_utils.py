@@ -0,0 +1,44 @@
+"""
+main.py / deepfri.py / interpro.py 共用的小工具：
+响应解析、轮询退避、GO 本体下载与加载
+"""
+from functools import lru_cache
+import os
+import orjson
+import requests
+from goatools.obo_parser import GODag
+
+GO_OBO_URL = "http://geneontology.org/ontology/go-basic.obo"
+
+
+def json_of(resp):
+    """用 orjson 解析响应体，比 resp.json() 更快"""
+    return orjson.loads(resp.content)
+
+
+def backoff(start: float, cap: float):
+    """指数退避间隔：start, 2*start, 4*start ... 封顶 cap"""
+    delay = min(start, cap)
+    while True:
+        yield delay
+        delay = min(delay * 2, cap)
+
+
+def ensure_obo(path: str) -> str:
+    """path 不存在时从 GO_OBO_URL 流式下载；已存在的文件（含自备的 OBO）不会被覆盖"""
+    if os.path.exists(path):
+        return path
+    tmp = path + ".part"   # 先写临时文件再改名，下载中断不会留下残缺的 path
+    with requests.get(GO_OBO_URL, stream=True, timeout=60) as r:
+        r.raise_for_status()
+        with open(tmp, "wb") as f:
+            for chunk in r.iter_content(1 << 16):
+                f.write(chunk)
+    os.replace(tmp, path)
+    return path
+
+
+@lru_cache(maxsize=4)
+def load_godag(obo_path: str) -> GODag:
+    """按路径缓存已解析的 GO DAG，同一进程内只解析一次"""
+    return GODag(obo_path)
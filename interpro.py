@@ -1,14 +1,18 @@
 import time
-import json
 import requests
 from Bio.PDB import PDBParser, PPBuilder
 import re
 from typing import List, Dict, Any
-from goatools.obo_parser import GODag
 from goatools.goea.go_enrichment_ns import GOEnrichmentStudyNS
 from collections import Counter
 from typing import List, Dict, Any
 
+from go_utils import backoff, json_of, load_godag
+
+_GO_RE = re.compile(r"GO:\d{7}")
+_PDB_PARSER = PDBParser(QUIET=True)
+_PPB = PPBuilder()
+
 # =====================================================
 # 函数1️⃣：从PDB文件中提取蛋白质序列
 # =====================================================
@@ -21,19 +25,16 @@ def extract_sequence_from_pdb(pdb_file, chain_id=None):
     返回:
         str: 蛋白质序列
     """
-    parser = PDBParser(QUIET=True)
-    structure = parser.get_structure("protein", pdb_file)
-    ppb = PPBuilder()
+    structure = _PDB_PARSER.get_structure("protein", pdb_file)
 
-    sequence = ""
+    parts = []  # 先收集片段，最后一次性拼接
     for model in structure:
         for chain in model:
             if chain_id and chain.id != chain_id:
                 continue
-            for pp in ppb.build_peptides(chain):
-                sequence += str(pp.get_sequence())
+            parts.extend(str(pp.get_sequence()) for pp in _PPB.build_peptides(chain))
         break  # 只取第一个 model
-    return sequence
+    return "".join(parts)
 
 # =====================================================
 # 函数2️⃣：基于 InterProScan API 的序列功能预测
@@ -45,7 +46,7 @@ def interpro_predict(sequence, email="your_email@example.com", wait_interval=20)
     参数:
         sequence (str): 蛋白质氨基酸序列
         email (str): 你的邮箱（EBI要求用于任务标识）
-        wait_interval (int): 查询任务状态的间隔秒数
+        wait_interval (int): 查询任务状态的最大间隔秒数（从 1 秒起指数退避）
 
     返回:
         dict: InterProScan 的预测结果(JSON对象)
@@ -67,7 +68,7 @@ def interpro_predict(sequence, email="your_email@example.com", wait_interval=20)
 
     # Step 2: 等待任务完成
     status_url = f"https://www.ebi.ac.uk/Tools/services/rest/iprscan5/status/{job_id}"
-    while True:
+    for delay in backoff(1.0, wait_interval):
         status = requests.get(status_url).text.strip()
         print(f"[⌛] 当前状态: {status}")
         if status == "FINISHED":
@@ -75,7 +76,7 @@ def interpro_predict(sequence, email="your_email@example.com", wait_interval=20)
             break
         elif status in ["ERROR", "FAILURE"]:
             raise Exception("InterProScan 任务失败！")
-        time.sleep(wait_interval)
+        time.sleep(delay)
 
     # Step 3: 获取结果（JSON 格式）
     result_url = f"https://www.ebi.ac.uk/Tools/services/rest/iprscan5/result/{job_id}/json"
@@ -83,7 +84,7 @@ def interpro_predict(sequence, email="your_email@example.com", wait_interval=20)
     if result_response.status_code != 200:
         raise Exception(f"结果获取失败: {result_response.text}")
 
-    result = result_response.json()
+    result = json_of(result_response)
     print("[💾] 获取预测结果成功！")
     return result
 
@@ -99,7 +100,7 @@ def extract_main_data(result: Dict[str, Any]) -> List[Dict[str, Any]]:
       - signature_description (from signature.description)
       - entry_accession (from signature.entry.accession)
       - entry_description (from signature.entry.description)
-      - go_terms: list of dicts, each {'id','name','category'} (可为空列表)
+      - go_terms: tuple of dicts, each {'id','name','category'} (可为空)，同一 match 的记录共享
       - start, end, score (from location)
       - model_ac (from match['model-ac'])
       - alignment (from location)
@@ -144,9 +145,9 @@ def extract_main_data(result: Dict[str, Any]) -> List[Dict[str, Any]]:
                     if not (isinstance(gid, str) and gid.startswith('GO:')):
                         for v in g.values():
                             if isinstance(v, str):
-                                found = re.findall(r'GO:\d{7}', v)
+                                found = _GO_RE.search(v)
                                 if found:
-                                    gid = found[0]
+                                    gid = found.group()
                                     break
 
                     if isinstance(gid, str) and gid.startswith('GO:'):
@@ -160,17 +161,26 @@ def extract_main_data(result: Dict[str, Any]) -> List[Dict[str, Any]]:
 
             # 如果没有在 candidate_lists 找到 goXRefs，但 entry 或 signature 里可能包含 GO 字符串（备用查找）
             if not go_terms:
-                # 在 entry 的任意字符串字段中找 GO:xxxxxx
-                for container in (entry, signature, match):
-                    for v in (container or {}).values():
-                        if isinstance(v, str) and 'GO:' in v:
-                            founds = re.findall(r'GO:\d{7}', v)
-                            for f in founds:
-                                if f not in seen_go_ids:
-                                    seen_go_ids.add(f)
-                                    go_terms.append({'id': f, 'name': None, 'category': None})
+                # 把 entry / signature / match 的字符串字段拼接后一次性找 GO:xxxxxx
+                blob = "\n".join(
+                    v for container in (entry, signature, match)
+                    for v in (container or {}).values() if isinstance(v, str)
+                )
+                for f in _GO_RE.findall(blob):
+                    if f not in seen_go_ids:
+                        seen_go_ids.add(f)
+                        go_terms.append({'id': f, 'name': None, 'category': None})
                 # 仍为空则保留空列表
 
+            # 同一 match 下各记录共享的字段只构建一次；go_terms 转为不可变 tuple 共享，无需逐条拷贝
+            base = {
+                'accession': signature.get('accession'),
+                'name': signature.get('name'),
+                'entry_accession': entry.get('accession'),
+                'entry_description': entry.get('description'),
+                'go_terms': tuple(go_terms),
+            }
+
             # 对每个 representative location 生成一条记录
             for loc in locations:
                 if not isinstance(loc, dict):
@@ -178,24 +188,20 @@ def extract_main_data(result: Dict[str, Any]) -> List[Dict[str, Any]]:
                 if not loc.get('representative', False):
                     continue
 
-                record = {
-                    'accession': signature.get('accession'),
-                    'name': signature.get('name'),
-                    'entry_accession': entry.get('accession'),
-                    'entry_description': entry.get('description'),
-                    'go_terms': go_terms.copy(),   # 每条记录独立拷贝
+                out.append({
+                    **base,
                     'start': loc.get('start'),
                     'end': loc.get('end'),
                     'score': loc.get('score'),
-                }
-                out.append(record)
+                })
 
     return out
 
 # =====================================================
 # 函数4️⃣：富集分析
 # =====================================================
-def go_analysis(records: List[Dict[str, Any]], obo_file: str = "go-basic.obo"):
+def go_analysis(records: List[Dict[str, Any]], obo_file: str = "go-basic.obo",
+                propagate_counts: bool = False):
     """
     综合 GO 分析：
     - 单蛋白/少量 GO 时：统计并打印 GO Term 分布
@@ -204,6 +210,7 @@ def go_analysis(records: List[Dict[str, Any]], obo_file: str = "go-basic.obo"):
     参数:
         records (List[Dict]): extract_main_data 输出的记录列表
         obo_file (str): GO DAG 文件路径
+        propagate_counts (bool): 是否沿 DAG 向上传播计数（默认关闭，与 deepfri.py 一致）
     """
     # 收集 GO 注释
     protein_to_go = {}  # protein_index -> list of GO IDs
@@ -218,7 +225,7 @@ def go_analysis(records: List[Dict[str, Any]], obo_file: str = "go-basic.obo"):
         return
 
     # 加载 GO DAG
-    godag = GODag(obo_file)
+    godag = load_godag(obo_file)
 
     # 判断是否做富集分析
     if len(protein_to_go) < 2 or len(all_go_ids) < 5:
@@ -234,16 +241,15 @@ def go_analysis(records: List[Dict[str, Any]], obo_file: str = "go-basic.obo"):
 
     # 多蛋白/GO，做富集分析
     # 构建背景集：所有蛋白的 GO
-    population = set(all_go_ids)
-    assoc = {p: gos for p, gos in protein_to_go.items()}
+    population = frozenset(all_go_ids)
     study = list(population)  # 简化处理，用所有 GO 做研究集
 
     # 初始化富集分析
     goeaobj = GOEnrichmentStudyNS(
         list(population),
-        assoc,
+        protein_to_go,
         godag,
-        propagate_counts=True,
+        propagate_counts=propagate_counts,
         alpha=0.05,
         methods=["fdr_bh"]
     )
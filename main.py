@@ -4,34 +4,106 @@
 无需 Wang 模块，仅依赖 goatools 最短路径
 """
 from typing import Dict, Set, List, Tuple
+from collections import deque
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from functools import lru_cache
 import os
 import time
-import re
+import zipfile
+import numpy as np
 import requests
+from requests_toolbelt import MultipartEncoder
 from Bio.PDB import PDBParser, PPBuilder
 from goatools.obo_parser import GODag
+from go_utils import backoff, ensure_obo, json_of
 
 # ---------------- 常量 ----------------
 INTERPRO_WAIT = 20
+DEEPFRI_WAIT = 2
+POLL_START = 1.0            # 轮询退避起始间隔（秒）
 DEEPFRI_WORKSPACE = "HE93D7"
-GO_OBO = "go-basic.obo"     # 需存在于当前目录或指定路径
-godag = GODag(GO_OBO)
+DEEPFRI_MODELS = ("cnn_cc", "cnn_mf", "cnn_bp")
+GO_OBO = "go-basic.obo"     # 当前目录或指定路径；缺失时自动下载
+_EMPTY_IDX = np.empty(0, dtype=np.int32)
+_NO_PATH = np.iinfo(np.int32).max // 2   # 非祖先占位步数，两者相加也不会溢出
+_BROADCAST_LIMIT = 1 << 24               # 语义距离广播时单块最多元素数
+_PDB_PARSER = PDBParser(QUIET=True)
+_PPB = PPBuilder()
 # -------------------------------------
 
 
 # ============ 工具函数 ============
+def _obo_stamp(obo: str) -> np.ndarray:
+    """OBO 的 (字节数, mtime 纳秒)，作为 parents 缓存的有效性标记"""
+    st = os.stat(obo)
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+def _read_parents_cache(path: str, stamp: np.ndarray) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """读取 .npz 缓存（不允许 pickle）；与 OBO 标记不符或内容不完整时抛出 ValueError"""
+    with np.load(path, allow_pickle=False) as data:
+        if not np.array_equal(data["obo_stamp"], stamp):
+            raise ValueError(f"parents cache {path} is stale")
+        ids = data["ids"].tolist()
+        indptr = data["indptr"]
+        indices = data["indices"].astype(np.int32, copy=False)
+    if len(indptr) != len(ids) + 1 or (len(indptr) and indptr[-1] != len(indices)):
+        raise ValueError(f"parents cache {path} is inconsistent")
+    return ids, indptr, indices
+
+
+def _load_parents_table(obo: str) -> Tuple[Dict[str, int], List[np.ndarray]]:
+    """
+    返回 (GO id -> 整数下标, 各 term 的 parents 下标数组)。
+    缓存 obo + ".parents.npz" 记录了生成时 OBO 的字节数与 mtime，二者完全一致才直接读取，
+    跳过 OBO 文本解析（wget 会把 mtime 设为服务器时间，不能只比较新旧）；
+    缓存以 CSR（ids, indptr, indices）形式存储，过期、损坏或不兼容时回退为重新解析 OBO。
+    """
+    cache = obo + ".parents.npz"
+    stamp = _obo_stamp(obo)
+    if os.path.exists(cache):
+        try:
+            ids, indptr, indices = _read_parents_cache(cache, stamp)
+            return {go_id: i for i, go_id in enumerate(ids)}, np.split(indices, indptr[1:-1])
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            pass
+
+    dag = GODag(obo)
+    ids = list(dag)
+    id2idx = {go_id: i for i, go_id in enumerate(ids)}
+    parents = [
+        np.fromiter((id2idx[p.id] for p in dag[go_id].parents), dtype=np.int32)
+        for go_id in ids
+    ]
+    indptr = np.cumsum([0] + [len(par) for par in parents])
+    indices = np.concatenate(parents) if parents else np.empty(0, dtype=np.int32)
+    # 缓存只是加速手段：目录只读、磁盘已满等写入失败时直接使用刚构建的表
+    tmp = cache + ".part"
+    try:
+        with open(tmp, "wb") as f:
+            np.savez(f, ids=np.array(ids), indptr=indptr, indices=indices, obo_stamp=stamp)
+        os.replace(tmp, cache)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+    return id2idx, parents
+
+
+# GO id -> 整数下标；_PARENTS_IDX[i] 为第 i 个 term 的 parents 下标数组
+_ID2IDX, _PARENTS_IDX = _load_parents_table(ensure_obo(GO_OBO))
+
+
 def _extract_seq(pdb_path: str) -> str:
     """从 PDB 提取第一条多肽链序列"""
-    parser = PDBParser(QUIET=True)
-    structure = parser.get_structure("X", pdb_path)
-    ppb = PPBuilder()
-    seq = ""
+    structure = _PDB_PARSER.get_structure("X", pdb_path)
+    parts = []
     for model in structure:
         for chain in model:
-            for pp in ppb.build_peptides(chain):
-                seq += str(pp.get_sequence())
+            parts.extend(str(pp.get_sequence()) for pp in _PPB.build_peptides(chain))
         break
-    return seq
+    return "".join(parts)
 
 
 def _interpro(seq: str, email: str) -> Set[str]:
@@ -42,17 +114,17 @@ def _interpro(seq: str, email: str) -> Set[str]:
     job_id = resp.text.strip()
 
     status_url = f"https://www.ebi.ac.uk/Tools/services/rest/iprscan5/status/{job_id}"
-    while True:
+    for delay in backoff(POLL_START, INTERPRO_WAIT):
         status = requests.get(status_url).text.strip()
         if status == "FINISHED":
             break
         if status in {"ERROR", "FAILURE"}:
             raise RuntimeError("InterProScan failed")
-        time.sleep(INTERPRO_WAIT)
+        time.sleep(delay)
 
-    result = requests.get(
+    result = json_of(requests.get(
         f"https://www.ebi.ac.uk/Tools/services/rest/iprscan5/result/{job_id}/json"
-    ).json()
+    ))
 
     go_set = set()
     results = result.get("results", [])
@@ -63,7 +135,8 @@ def _interpro(seq: str, email: str) -> Set[str]:
             entry = m.get("signature", {}).get("entry") or {}
             for g in entry.get("goXRefs", []):
                 go_id = g.get("id") or ""
-                if re.match(r"GO:\d{7}", go_id):
+                # GO:ddddddd 结构简单，直接按长度/前缀/数字判断
+                if len(go_id) == 10 and go_id.startswith("GO:") and go_id[3:].isdigit():
                     go_set.add(go_id)
     return go_set
 
@@ -79,79 +152,67 @@ def _deepfri(pdb_path: str) -> Dict[str, float]:
         "user-agent": "Mozilla/5.0",
     }
     with open(pdb_path, "rb") as f:
-        files = {"file": (os.path.basename(pdb_path), f, "application/octet-stream")}
-        data = {"inputType": "structureFile", "tags": ""}
-        up_resp = session.post(upload_url, files=files, data=data, headers=headers)
+        m = MultipartEncoder(fields={
+            "file": (os.path.basename(pdb_path), f, "application/octet-stream"),
+            "inputType": "structureFile",
+            "tags": "",
+        })
+        up_resp = session.post(upload_url, data=m,
+                               headers={**headers, "Content-Type": m.content_type})
     up_resp.raise_for_status()
-    task_name = up_resp.json()["predictions"][0]["name"]
+    task_name = json_of(up_resp)["predictions"][0]["name"]
 
     task_url = f"https://beta.api.deepfri.flatironinstitute.org/workspace/{DEEPFRI_WORKSPACE}/predictions/{task_name}"
-    while True:
-        info = session.get(task_url, headers=headers).json()
-        state = (info.get("prediction") or info.get("predictions", [{}])[0]).get("state", "")
+    for delay in backoff(POLL_START, DEEPFRI_WAIT):
+        info = json_of(session.get(task_url, headers=headers))
+        pred = info.get("prediction") or info.get("predictions", [{}])[0]
+        state = pred.get("state", "")
         if state == "finished":
-            final_data = (info.get("prediction") or info.get("predictions", [{}])[0]).get("data", {})
+            final_data = pred.get("data", {})
             break
         if state == "failed":
             raise RuntimeError("DeepFRI failed")
-        time.sleep(2)
+        time.sleep(delay)
 
-    go_score = {}
-    for model in ["cnn_cc", "cnn_mf", "cnn_bp"]:
-        for p in final_data.get("A", {}).get(model, {}).get("predictions", []):
-            go_score[p["go_term"]] = float(p["go_term_score"])
-    return go_score
+    chain_a = final_data.get("A", {})
+    return {
+        p["go_term"]: float(p["go_term_score"])
+        for model in DEEPFRI_MODELS
+        for p in chain_a.get(model, {}).get("predictions", [])
+    }
 
 
-def _go_distance(go1: str, go2: str) -> int:
+@lru_cache(maxsize=None)
+def _ancestor_depths(go_id: str) -> Tuple[np.ndarray, np.ndarray]:
     """
-    计算两个 GO term 在 DAG 中的最短路径距离（边数）。
-    若两个 term 相同则距离为 0；
-    若无法连通则返回 None。
+    从 go_id 出发沿整数化的 parents 表做一次 BFS，
+    返回 (祖先下标数组（升序，含自身）, 对应最短步数数组)；
+    term 不存在时返回两个空数组。
     """
-    if go1 == go2:
-        return 0
-    # 把字符串转成 GODag 节点
-    a = godag.get(go1)
-    b = godag.get(go2)
-    if a is None or b is None:
-        return None
-
-    # 收集 a 的所有祖先（含自己）
-    a_anc = {go1} | a.get_all_parents()
-    # 收集 b 的所有祖先（含自己）
-    b_anc = {go2} | b.get_all_parents()
-    # 公共祖先集合
-    common = a_anc & b_anc
-    if not common:
-        return None
-
-    # 对每个公共祖先计算 (a 到祖先步数 + b 到祖先步数)
-    def _min_steps(start_go, target_set):
-        """BFS 求最短步数"""
-        from collections import deque
-        queue = deque([(start_go, 0)])
-        seen = {start_go}
-        while queue:
-            cur, step = queue.popleft()
-            if cur in target_set:
-                return step
-            node = godag.get(cur)
-            if node is None:
-                continue
-            for par in node.parents:
-                if par.id not in seen:
-                    seen.add(par.id)
-                    queue.append((par.id, step + 1))
-        return None
-
-    best = None
-    for ca in common:
-        da = _min_steps(go1, {ca})
-        db = _min_steps(go2, {ca})
-        if da is not None and db is not None:
-            best = min(best, da + db) if best is not None else da + db
-    return best
+    start = _ID2IDX.get(go_id)
+    if start is None:
+        return _EMPTY_IDX, _EMPTY_IDX
+    depth = np.full(len(_PARENTS_IDX), -1, dtype=np.int16)
+    depth[start] = 0
+    queue = deque([start])
+    while queue:
+        cur = queue.popleft()
+        step = int(depth[cur]) + 1
+        for par in _PARENTS_IDX[cur].tolist():
+            if depth[par] < 0:
+                depth[par] = step
+                queue.append(par)
+    anc_idx = np.flatnonzero(depth >= 0).astype(np.int32)
+    return anc_idx, depth[anc_idx].astype(np.int32)
+
+
+def _depth_matrix(ancs: List[Tuple[np.ndarray, np.ndarray]], support: np.ndarray) -> np.ndarray:
+    """把每个 term 的 (祖先下标, 步数) 填入 (len(ancs), len(support)) 矩阵，非祖先位置为 _NO_PATH"""
+    mat = np.full((len(ancs), len(support)), _NO_PATH, dtype=np.int32)
+    for i, (idx, dep) in enumerate(ancs):
+        mat[i, np.searchsorted(support, idx)] = dep
+    return mat
+
 
 def _semantic_pairs(setA: Set[str], setB: Set[str],
                     sim_threshold: float = 0.7) -> Tuple[float, List[Tuple[str, str, float]]]:
@@ -159,18 +220,32 @@ def _semantic_pairs(setA: Set[str], setB: Set[str],
     基于自写最短路径的归一化相似度
     返回 (avg_score, [(goA, goB, score), ...] 高于阈值)
     """
-    scores = []
-    for a in setA:
-        best = 0.0
-        pair = (a, "", 0.0)
-        for b in setB:
-            d = _go_distance(a, b)
-            sim = 1 / (1 + d) if d is not None else 0.0
-            if sim > best:
-                best = sim
-                pair = (a, b, sim)
-        if best > 0:
-            scores.append(pair)
+    # 完全相同的 term 相似度必为 1.0，无需再比较
+    exact = setA & setB
+    scores = [(a, a, 1.0) for a in exact]
+
+    rest_a = list(setA - exact)
+    list_b = list(setB)
+    anc_a = [_ancestor_depths(a) for a in rest_a]
+    anc_b = [_ancestor_depths(b) for b in list_b]
+    # 只保留实际出现的祖先列，避免 (|A|, N_go) 的稠密矩阵
+    support = np.unique(np.concatenate([idx for idx, _ in anc_a + anc_b] or [_EMPTY_IDX]))
+    if rest_a and list_b and support.size:
+        D_A = _depth_matrix(anc_a, support)
+        D_B = _depth_matrix(anc_b, support)
+        # dist[i, j] = min_c (D_A[i, c] + D_B[j, c])；按行分块限制广播内存
+        step = max(1, _BROADCAST_LIMIT // max(1, D_B.size))
+        dist = np.concatenate([
+            (D_A[i:i + step, None, :] + D_B[None, :, :]).min(axis=2)
+            for i in range(0, len(rest_a), step)
+        ])
+        sim = np.where(dist < _NO_PATH, 1.0 / (1.0 + dist), 0.0)
+        best_b = sim.argmax(axis=1)
+        best_sim = sim.max(axis=1)
+        for a, j, best in zip(rest_a, best_b.tolist(), best_sim.tolist()):
+            if best > 0:
+                scores.append((a, list_b[j], best))
+
     if not scores:
         return 0.0, []
     avg_score = sum(s for _, _, s in scores) / len(scores)
@@ -185,18 +260,33 @@ def analyze_pdb(pdb_path: str, email: str = "2805238699@qq.com",
     输入 PDB 文件路径，返回含精确+语义一致性的完整对比字典
     """
     seq = _extract_seq(pdb_path)
-    ipro_go = _interpro(seq, email)
-    df_go = _deepfri(pdb_path)
+    # 两个远程任务互不依赖，并行提交与轮询
+    ex = ThreadPoolExecutor(max_workers=2)
+    try:
+        f_ipro = ex.submit(_interpro, seq, email)
+        f_df = ex.submit(_deepfri, pdb_path)
+        # 任一任务先失败就立即返回，而不是按提交顺序依次等待
+        done, _ = wait([f_ipro, f_df], return_when=FIRST_EXCEPTION)
+        for fut in done:
+            if fut.exception() is not None:
+                fut.result()  # 重新抛出该任务的异常
+        ipro_go = f_ipro.result()
+        df_go = f_df.result()
+    finally:
+        # 失败时不等待另一个仍在轮询的任务；其线程会在轮询结束后退出，可能推迟解释器退出
+        ex.shutdown(wait=False, cancel_futures=True)
+    df_keys = frozenset(df_go)
 
     # 精确匹配
-    common = ipro_go & df_go.keys()
-    ipro_only = ipro_go - df_go.keys()
-    df_only = df_go.keys() - ipro_go
-    jaccard = len(common) / len(ipro_go | df_go.keys()) if (ipro_go | df_go.keys()) else 0.0
+    common = ipro_go & df_keys
+    ipro_only = ipro_go - df_keys
+    df_only = set(df_keys - ipro_go)
+    union = ipro_go | df_keys
+    jaccard = len(common) / len(union) if union else 0.0
     high_conf_common = {go for go in common if df_go[go] >= 0.8}
 
     # 语义相似性
-    avg_sem_sim, sem_pairs = _semantic_pairs(ipro_go, df_go.keys(), sim_threshold=sem_sim_threshold)
+    avg_sem_sim, sem_pairs = _semantic_pairs(ipro_go, df_keys, sim_threshold=sem_sim_threshold)
 
     return {
         "interpro_count": len(ipro_go),